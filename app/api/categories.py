@@ -1,96 +1,118 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict
 from app.database import get_db
-from app.models import Category, File
+from app.models import Category, File, Chunk
 from app.schemas import CategoryCreate, CategoryResponse
-from app.services.vector_store import vector_store_service
+from app.tasks.celery_tasks import cleanup_category_task
 from loguru import logger
+import time
 
 router = APIRouter(prefix="/api/categories", tags=["Categories"])
 
+# Category ids recently confirmed to exist, mapped to when that confirmation expires.
+# Deletes evict locally; the TTL bounds staleness across API workers.
+CATEGORY_CACHE_TTL_SECONDS = 60
+_known_categories: Dict[int, float] = {}
+
+async def verify_category(db: AsyncSession, category_id: int):
+    """Raise 404 unless the category exists, skipping the query for recently seen ids"""
+    expires_at = _known_categories.get(category_id)
+    if expires_at is not None and expires_at > time.monotonic():
+        return
+    
+    category = await db.get(Category, category_id)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    
+    _known_categories[category_id] = time.monotonic() + CATEGORY_CACHE_TTL_SECONDS
+
 @router.post("/create", response_model=CategoryResponse)
-def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
+async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_db)):
     """Create a new category"""
     
-    # Check if category already exists
-    existing = db.query(Category).filter(Category.name == category.name).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Category already exists")
-    
-    # Create category
+    # Create category; the unique constraint on name rejects duplicates
     db_category = Category(
         name=category.name,
         description=category.description
     )
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Category already exists")
+    await db.refresh(db_category)
     
     logger.info(f"Created category: {category.name} (ID: {db_category.id})")
     
-    # Get file count
-    file_count = db.query(File).filter(File.category_id == db_category.id).count()
-    
     return CategoryResponse(
         id=db_category.id,
         name=db_category.name,
         description=db_category.description,
         created_at=db_category.created_at,
-        file_count=file_count
+        file_count=db_category.file_count
     )
 
 @router.get("/list", response_model=List[CategoryResponse])
-def list_categories(db: Session = Depends(get_db)):
+async def list_categories(db: AsyncSession = Depends(get_db)):
     """List all categories"""
     
-    categories = db.query(Category).all()
+    categories = (await db.execute(select(Category))).scalars().all()
     
     result = []
     for cat in categories:
-        file_count = db.query(File).filter(File.category_id == cat.id).count()
         result.append(CategoryResponse(
             id=cat.id,
             name=cat.name,
             description=cat.description,
             created_at=cat.created_at,
-            file_count=file_count
+            file_count=cat.file_count
         ))
     
     return result
 
 @router.get("/{category_id}", response_model=CategoryResponse)
-def get_category(category_id: int, db: Session = Depends(get_db)):
+async def get_category(category_id: int, db: AsyncSession = Depends(get_db)):
     """Get category by ID"""
     
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    file_count = db.query(File).filter(File.category_id == category.id).count()
-    
     return CategoryResponse(
         id=category.id,
         name=category.name,
         description=category.description,
         created_at=category.created_at,
-        file_count=file_count
+        file_count=category.file_count
     )
 
-@router.delete("/{category_id}")
-def delete_category(category_id: int, db: Session = Depends(get_db)):
+@router.delete("/{category_id}", status_code=202)
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a category and all its files"""
     
-    category = db.query(Category).filter(Category.id == category_id).first()
+    category = await db.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    # Delete from vector store
-    vector_store_service.delete_by_category_id(category_id)
+    _known_categories.pop(category_id, None)
+    
+    file_paths = (await db.execute(
+        select(File.file_path).filter(File.category_id == category_id)
+    )).scalars().all()
+    
+    # Delete rows in bulk rather than loading every file and chunk for the ORM cascade
+    file_ids = select(File.id).filter(File.category_id == category_id)
+    await db.execute(delete(Chunk).filter(Chunk.file_id.in_(file_ids)))
+    await db.execute(delete(File).filter(File.category_id == category_id))
+    await db.execute(delete(Category).filter(Category.id == category_id))
+    await db.commit()
     
-    # Delete category (cascades to files and chunks)
-    db.delete(category)
-    db.commit()
+    # Vectors and uploaded files are removed by the worker
+    cleanup_category_task.apply_async(args=[category_id, file_paths])
     
     logger.info(f"Deleted category: {category.name} (ID: {category_id})")
     
@@ -1,77 +1,127 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File as FastAPIFile, Form
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File as FastAPIFile, Form
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from datetime import datetime, timezone
+from wsgiref.handlers import format_date_time
 import os
-import shutil
+import aiofiles
 from app.database import get_db
+from app.api.categories import verify_category
 from app.models import Category, File
 from app.schemas import FileUploadResponse, FileStatusResponse, FileListResponse, TaskStatusResponse
 from app.config import settings
-from app.tasks.celery_tasks import process_file_task, celery_app
-from app.services.vector_store import vector_store_service
+from app.tasks.celery_tasks import process_file_task, process_files_batch_task, cleanup_file_task, celery_app
 from loguru import logger
 import uuid
 
 router = APIRouter(prefix="/api/files", tags=["Files"])
 
-ALLOWED_EXTENSIONS = {
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+UPLOAD_DIR = settings.UPLOAD_DIR
+POLL_CACHE_CONTROL = "private, max-age=5"
+
+ALLOWED_EXTENSIONS = frozenset({
     '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.txt', '.csv',
     '.jpg', '.jpeg', '.png', '.bmp', '.tiff',
     '.ppt', '.pptx', '.json', '.sql', '.xml'
-}
+})
+ALLOWED_EXTENSIONS_STR = ", ".join(sorted(ALLOWED_EXTENSIONS))
 
 def validate_file(file: UploadFile) -> str:
     """Validate file type and size"""
     # Get file extension
-    file_ext = os.path.splitext(file.filename)[1].lower()
+    _, dot, ext = file.filename.rpartition(".")
+    file_ext = f".{ext.lower()}" if dot else ""
     
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"File type {file_ext} not supported. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
+            detail=f"File type {file_ext} not supported. Allowed types: {ALLOWED_EXTENSIONS_STR}"
         )
     
     return file_ext
 
+def set_poll_cache_headers(response: Response, last_modified: Optional[datetime]):
+    """Let clients reuse a polled response for a few seconds"""
+    response.headers["Cache-Control"] = POLL_CACHE_CONTROL
+    if last_modified:
+        # Timestamps are stored as naive UTC
+        response.headers["Last-Modified"] = format_date_time(
+            last_modified.replace(tzinfo=timezone.utc).timestamp()
+        )
+
+async def save_upload(file: UploadFile) -> Tuple[str, str, int]:
+    """Stream an upload to disk, returning its stored name, path and size"""
+    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    
+    # Generate unique filename
+    unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
+    file_path = os.path.join(UPLOAD_DIR, unique_filename)
+    
+    # Save file, enforcing the size limit while streaming
+    file_size = 0
+    too_large = False
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > max_size:
+                    too_large = True
+                    break
+                await buffer.write(chunk)
+    except Exception as e:
+        logger.error(f"Error saving file: {e}")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(status_code=500, detail="Error saving file")
+    
+    if too_large:
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=400,
+            detail=f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB"
+        )
+    
+    return unique_filename, file_path, file_size
+
+async def add_to_file_count(db: AsyncSession, category_id: int, count: int, file_paths: List[str]):
+    """Bump the category's file_count, discarding the saved uploads if the category is gone"""
+    result = await db.execute(
+        update(Category)
+        .where(Category.id == category_id)
+        .values(file_count=Category.file_count + count)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        # verify_category is cached per process, so another worker may have
+        # deleted the category since; the UPDATE holds its row until commit
+        await db.rollback()
+        for file_path in file_paths:
+            os.remove(file_path)
+        raise HTTPException(status_code=404, detail="Category not found")
+
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
     file: UploadFile = FastAPIFile(...),
     category_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload a file for processing"""
     
     # Validate category exists
-    category = db.query(Category).filter(Category.id == category_id).first()
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
+    await verify_category(db, category_id)
     
     # Validate file
     file_ext = validate_file(file)
     
-    # Check file size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
+    unique_filename, file_path, file_size = await save_upload(file)
     
-    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    if file_size > max_size:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Max size: {settings.MAX_FILE_SIZE_MB}MB"
-        )
+    await add_to_file_count(db, category_id, 1, [file_path])
     
-    # Generate unique filename
-    unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
-    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-    
-    # Save file
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        logger.error(f"Error saving file: {e}")
-        raise HTTPException(status_code=500, detail="Error saving file")
+    # Pre-generate the Celery task ID so the row is written with it in one commit
+    task_id = str(uuid.uuid4())
     
     # Create database entry
     db_file = File(
@@ -81,31 +131,88 @@ async def upload_file(
         file_type=file_ext,
         file_size=file_size,
         category_id=category_id,
-        status="pending"
+        status="pending",
+        task_id=task_id
     )
     db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
-    
-    # Start async processing
-    task = process_file_task.apply_async(args=[db_file.id])
+    await db.commit()
     
-    # Update task ID
-    db_file.task_id = task.id
-    db.commit()
+    # Start async processing once the row is committed
+    process_file_task.apply_async(args=[db_file.id], task_id=task_id)
     
-    logger.info(f"File uploaded: {file.filename} (ID: {db_file.id}, Task: {task.id})")
+    logger.info(f"File uploaded: {file.filename} (ID: {db_file.id}, Task: {task_id})")
     
     return FileUploadResponse(
         file_id=db_file.id,
         filename=file.filename,
-        task_id=task.id,
+        task_id=task_id,
         status="pending",
         message="File uploaded successfully. Processing started."
     )
 
+@router.post("/upload-batch", response_model=List[FileUploadResponse])
+async def upload_files_batch(
+    files: List[UploadFile] = FastAPIFile(...),
+    category_id: int = Form(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload several files to be processed together in one task"""
+    
+    # Validate category exists
+    await verify_category(db, category_id)
+    
+    # Validate every file before writing any of them
+    file_exts = [validate_file(file) for file in files]
+    
+    saved = []
+    try:
+        for file in files:
+            saved.append(await save_upload(file))
+    except HTTPException:
+        # Don't leave the earlier files of a rejected batch on disk
+        for _, file_path, _ in saved:
+            os.remove(file_path)
+        raise
+    
+    await add_to_file_count(db, category_id, len(saved), [file_path for _, file_path, _ in saved])
+    
+    # One task processes the whole batch, so every row shares its ID
+    task_id = str(uuid.uuid4())
+    
+    db_files = [
+        File(
+            filename=unique_filename,
+            original_filename=file.filename,
+            file_path=file_path,
+            file_type=file_ext,
+            file_size=file_size,
+            category_id=category_id,
+            status="pending",
+            task_id=task_id
+        )
+        for file, file_ext, (unique_filename, file_path, file_size) in zip(files, file_exts, saved)
+    ]
+    db.add_all(db_files)
+    await db.commit()
+    
+    # Start async processing once the rows are committed
+    process_files_batch_task.apply_async(args=[[db_file.id for db_file in db_files]], task_id=task_id)
+    
+    logger.info(f"Uploaded batch of {len(db_files)} files (Task: {task_id})")
+    
+    return [
+        FileUploadResponse(
+            file_id=db_file.id,
+            filename=db_file.original_filename,
+            task_id=task_id,
+            status="pending",
+            message="File uploaded successfully. Processing started."
+        )
+        for db_file in db_files
+    ]
+
 @router.get("/status/{task_id}", response_model=TaskStatusResponse)
-def get_task_status(task_id: str, db: Session = Depends(get_db)):
+def get_task_status(task_id: str):
     """Get status of file processing task"""
     
     task = celery_app.AsyncResult(task_id)
@@ -124,41 +231,46 @@ def get_task_status(task_id: str, db: Session = Depends(get_db)):
     
     return response
 
-@router.get("/list", response_model=List[FileListResponse])
-def list_files(category_id: int = None, db: Session = Depends(get_db)):
+@router.get("/list", response_model=None, responses={200: {"model": List[FileListResponse]}})
+async def list_files(category_id: int = None, db: AsyncSession = Depends(get_db)):
     """List all files, optionally filtered by category"""
     
-    query = db.query(File)
+    # Select only the listed columns, with the category name joined in
+    query = select(
+        File.id,
+        File.filename,
+        File.original_filename,
+        File.file_type,
+        File.file_size,
+        File.category_id,
+        Category.name.label("category_name"),
+        File.status,
+        File.total_chunks,
+        File.created_at
+    ).join(Category, File.category_id == Category.id).filter(File.status != "deleting")
     if category_id:
         query = query.filter(File.category_id == category_id)
     
-    files = query.all()
-    
-    result = []
-    for file in files:
-        result.append(FileListResponse(
-            id=file.id,
-            filename=file.filename,
-            original_filename=file.original_filename,
-            file_type=file.file_type,
-            file_size=file.file_size,
-            category_id=file.category_id,
-            category_name=file.category.name,
-            status=file.status,
-            total_chunks=file.total_chunks,
-            created_at=file.created_at
-        ))
-    
-    return result
+    rows = (await db.execute(query)).mappings().all()
+    
+    # Rows are trusted DB output in FileListResponse shape; skip per-item validation
+    response = ORJSONResponse([dict(row) for row in rows])
+    set_poll_cache_headers(
+        response,
+        max((row["created_at"] for row in rows if row["created_at"]), default=None)
+    )
+    return response
 
 @router.get("/{file_id}", response_model=FileStatusResponse)
-def get_file_status(file_id: int, db: Session = Depends(get_db)):
+async def get_file_status(file_id: int, response: Response, db: AsyncSession = Depends(get_db)):
     """Get file processing status"""
     
-    file = db.query(File).filter(File.id == file_id).first()
+    file = await db.get(File, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     
+    set_poll_cache_headers(response, file.processed_at or file.created_at)
+    
     return FileStatusResponse(
         file_id=file.id,
         filename=file.original_filename,
@@ -168,25 +280,26 @@ def get_file_status(file_id: int, db: Session = Depends(get_db)):
         processed_at=file.processed_at
     )
 
-@router.delete("/{file_id}")
-def delete_file(file_id: int, db: Session = Depends(get_db)):
+@router.delete("/{file_id}", status_code=202)
+async def delete_file(file_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a file"""
     
-    file = db.query(File).filter(File.id == file_id).first()
-    if not file:
+    file = await db.get(File, file_id)
+    if not file or file.status == "deleting":
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete from vector store
-    vector_store_service.delete_by_file_id(file_id)
-    
-    # Delete physical file
-    if os.path.exists(file.file_path):
-        os.remove(file.file_path)
+    # Tombstone the file; the worker removes vectors, the upload and the rows
+    file.status = "deleting"
+    await db.execute(
+        update(Category)
+        .where(Category.id == file.category_id)
+        .values(file_count=Category.file_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
     
-    # Delete from database (cascades to chunks)
-    db.delete(file)
-    db.commit()
+    cleanup_file_task.apply_async(args=[file_id])
     
-    logger.info(f"Deleted file: {file.original_filename} (ID: {file_id})")
+    logger.info(f"Scheduled deletion of file: {file.original_filename} (ID: {file_id})")
     
-    return {"message": "File deleted successfully", "file_id": file_id}
+    return {"message": "File deletion started", "file_id": file_id}
@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
 from app.database import get_db
-from app.models import Category
+from app.api.categories import verify_category
+from app.models import File
 from app.schemas import (
     SearchRequest, SearchResponse, SearchResult,
     SummarizeRequest, SummarizeResponse,
@@ -11,10 +15,15 @@ from app.schemas import (
 from app.services.embeddings import embeddings_service
 from app.services.vector_store import vector_store_service
 from app.services.gemini_service import gemini_service
+from app.services.cache import cache_service
 from loguru import logger
+import asyncio
 
 router = APIRouter(prefix="/api/search", tags=["Search"])
 
+# Chunks sent to Gemini for a category summary (limits prompt size)
+SUMMARY_MAX_CHUNKS = 50
+
 def distance_to_confidence(distance: float) -> float:
     """Convert cosine distance to confidence score"""
     # Cosine distance is 0-2, convert to confidence 0-1
@@ -22,23 +31,57 @@ def distance_to_confidence(distance: float) -> float:
     confidence = max(0.0, min(1.0, 1.0 - (distance / 2.0)))
     return round(confidence, 2)
 
+async def get_query_embedding(query: str) -> List[float]:
+    """Embed a query, reusing the cached vector for repeated queries"""
+    embedding = await cache_service.get_embedding(query)
+    if embedding is None:
+        embedding = await run_in_threadpool(embeddings_service.generate_embedding, query)
+        await cache_service.set_embedding(query, embedding)
+    return embedding
+
+async def embed_while_verifying(db: AsyncSession, category_id: int, query: str) -> asyncio.Task:
+    """Start embedding the query, then validate the category while the embedding runs"""
+    embedding_task = asyncio.create_task(get_query_embedding(query))
+    try:
+        await verify_category(db, category_id)
+    except BaseException:
+        # Don't leave the task orphaned; a thread already embedding runs to completion
+        embedding_task.cancel()
+        raise
+    return embedding_task
+
+async def get_category_version(db: AsyncSession, category_id: int) -> str:
+    """Version string for a category's indexed content, used to invalidate cached answers"""
+    result = await db.execute(
+        select(func.count(File.id), func.max(File.processed_at))
+        .filter(File.category_id == category_id, File.status == "completed")
+    )
+    file_count, last_processed_at = result.one()
+    return f"{file_count}:{last_processed_at}"
+
 @router.post("/query", response_model=SearchResponse)
-def search_query(request: SearchRequest, db: Session = Depends(get_db)):
+async def search_query(request: SearchRequest, db: AsyncSession = Depends(get_db)):
     """
     Semantic search across documents in a category
     """
     
     # Validate category exists
-    category = db.query(Category).filter(Category.id == request.category_id).first()
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
+    await verify_category(db, request.category_id)
     
     try:
-        # Generate query embedding
-        query_embedding = embeddings_service.generate_embedding(request.query)
+        # Reuse a previous answer if no files were processed since; checked
+        # before embedding so a cache hit never starts embedding work
+        version = await get_category_version(db, request.category_id)
+        cache_key = cache_service.answer_key("query", request.query, request.category_id, request.top_k, version)
+        cached = await cache_service.get_json(cache_key)
+        if cached:
+            return SearchResponse(**cached)
+        
+        query_embedding = await get_query_embedding(request.query)
         
         # Search vector store
-        search_results = vector_store_service.search(
+        search_results = await run_in_threadpool(
+            vector_store_service.search,
             query_embedding=query_embedding,
             category_id=request.category_id,
             top_k=request.top_k
@@ -55,7 +98,7 @@ def search_query(request: SearchRequest, db: Session = Depends(get_db)):
         context_chunks = [result["text"] for result in search_results]
         
         # Generate answer using Gemini
-        answer, confidence = gemini_service.generate_answer(request.query, context_chunks)
+        answer, confidence = await run_in_threadpool(gemini_service.generate_answer, request.query, context_chunks)
         
         # Format results
         formatted_results = []
@@ -66,30 +109,35 @@ def search_query(request: SearchRequest, db: Session = Depends(get_db)):
                 confidence_score=distance_to_confidence(result.get("distance", 1.0))
             ))
         
-        return SearchResponse(
+        response = SearchResponse(
             answer=answer,
             confidence_score=confidence,
             results=formatted_results
         )
+        await cache_service.set_json(cache_key, response.model_dump())
+        
+        return response
     
     except Exception as e:
         logger.error(f"Error in search query: {e}")
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
 @router.post("/summarize", response_model=SummarizeResponse)
-def summarize_category(request: SummarizeRequest, db: Session = Depends(get_db)):
+async def summarize_category(request: SummarizeRequest, db: AsyncSession = Depends(get_db)):
     """
     Summarize all documents in a category
     """
     
     # Validate category exists
-    category = db.query(Category).filter(Category.id == request.category_id).first()
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
+    await verify_category(db, request.category_id)
     
     try:
-        # Get all chunks from category
-        all_chunks = vector_store_service.get_all_chunks_by_category(request.category_id)
+        # Get chunks from category (limit to prevent token overflow)
+        all_chunks = await run_in_threadpool(
+            vector_store_service.get_all_chunks_by_category,
+            request.category_id,
+            limit=SUMMARY_MAX_CHUNKS
+        )
         
         if not all_chunks:
             return SummarizeResponse(
@@ -97,11 +145,10 @@ def summarize_category(request: SummarizeRequest, db: Session = Depends(get_db))
                 confidence_score=0.0
             )
         
-        # Extract texts (limit to prevent token overflow)
-        texts = [chunk["text"] for chunk in all_chunks[:50]]
+        texts = [chunk["text"] for chunk in all_chunks]
         
         # Generate summary
-        summary, confidence = gemini_service.summarize_documents(texts, request.max_length)
+        summary, confidence = await run_in_threadpool(gemini_service.summarize_documents, texts, request.max_length)
         
         return SummarizeResponse(
             summary=summary,
@@ -113,22 +160,28 @@ def summarize_category(request: SummarizeRequest, db: Session = Depends(get_db))
         raise HTTPException(status_code=500, detail=f"Summarization error: {str(e)}")
 
 @router.post("/qa", response_model=QAResponse)
-def question_answer(request: QARequest, db: Session = Depends(get_db)):
+async def question_answer(request: QARequest, db: AsyncSession = Depends(get_db)):
     """
     Answer a specific question based on documents in a category
     """
     
     # Validate category exists
-    category = db.query(Category).filter(Category.id == request.category_id).first()
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
+    await verify_category(db, request.category_id)
     
     try:
-        # Generate query embedding
-        query_embedding = embeddings_service.generate_embedding(request.question)
+        # Reuse a previous answer if no files were processed since; checked
+        # before embedding so a cache hit never starts embedding work
+        version = await get_category_version(db, request.category_id)
+        cache_key = cache_service.answer_key("qa", request.question, request.category_id, request.top_k, version)
+        cached = await cache_service.get_json(cache_key)
+        if cached:
+            return QAResponse(**cached)
+        
+        query_embedding = await get_query_embedding(request.question)
         
         # Search vector store
-        search_results = vector_store_service.search(
+        search_results = await run_in_threadpool(
+            vector_store_service.search,
             query_embedding=query_embedding,
             category_id=request.category_id,
             top_k=request.top_k
@@ -145,7 +198,7 @@ def question_answer(request: QARequest, db: Session = Depends(get_db)):
         context_chunks = [result["text"] for result in search_results]
         
         # Answer question using Gemini
-        answer, confidence = gemini_service.answer_question(request.question, context_chunks)
+        answer, confidence = await run_in_threadpool(gemini_service.answer_question, request.question, context_chunks)
         
         # Format relevant chunks
         relevant_chunks = []
@@ -156,33 +209,34 @@ def question_answer(request: QARequest, db: Session = Depends(get_db)):
                 confidence_score=distance_to_confidence(result.get("distance", 1.0))
             ))
         
-        return QAResponse(
+        response = QAResponse(
             answer=answer,
             confidence_score=confidence,
             relevant_chunks=relevant_chunks
         )
+        await cache_service.set_json(cache_key, response.model_dump())
+        
+        return response
     
     except Exception as e:
         logger.error(f"Error in Q&A: {e}")
         raise HTTPException(status_code=500, detail=f"Q&A error: {str(e)}")
 
 @router.post("/find-passages", response_model=FindPassagesResponse)
-def find_passages(request: FindPassagesRequest, db: Session = Depends(get_db)):
+async def find_passages(request: FindPassagesRequest, db: AsyncSession = Depends(get_db)):
     """
     Find relevant passages based on a query
     """
     
-    # Validate category exists
-    category = db.query(Category).filter(Category.id == request.category_id).first()
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
+    # Validate category exists while the query embedding is generated
+    embedding_task = await embed_while_verifying(db, request.category_id, request.query)
     
     try:
-        # Generate query embedding
-        query_embedding = embeddings_service.generate_embedding(request.query)
+        query_embedding = await embedding_task
         
         # Search vector store
-        search_results = vector_store_service.search(
+        search_results = await run_in_threadpool(
+            vector_store_service.search,
             query_embedding=query_embedding,
             category_id=request.category_id,
             top_k=request.top_k
@@ -15,6 +15,9 @@ class Settings(BaseSettings):
     
     # Database Configuration
     DATABASE_URL: str = "sqlite:///./genai_file_search.db"
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_RECYCLE_SECONDS: int = 3600
     
     # ChromaDB Configuration
     CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
@@ -24,6 +27,7 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://localhost:6379/0"
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/1"
+    QUERY_CACHE_TTL_SECONDS: int = 3600
     
     # File Upload Configuration
     UPLOAD_DIR: str = "./uploads"
@@ -1,24 +1,91 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from app.config import settings
 
+# Async driver for each backend DATABASE_URL may name
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+    "mariadb": "mariadb+aiomysql"
+}
+
+def _async_database_url(url: str) -> URL:
+    """Map a sync DATABASE_URL, whatever its driver, onto the matching async driver"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(
+            f"DATABASE_URL backend '{backend}' has no async driver; "
+            f"supported backends: {', '.join(sorted(_ASYNC_DRIVERS))}"
+        )
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend])
+
+# Pool sizing only applies to server databases; SQLite keeps its default pool
+_pool_options = {} if "sqlite" in settings.DATABASE_URL else {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW
+}
+
+# Sync engine: used by the Celery worker and for schema setup
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=True,
+    **_pool_options
+)
+
+# Thread-local sessions; call SessionLocal.remove() when a unit of work ends
+SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+
+# Async engine: used by the API request handlers
+async_engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=True,
+    **_pool_options
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    
+    # create_all skips tables that already exist, so add columns added since
+    # then and any indexes they are missing
+    existing_columns = {column["name"] for column in inspect(engine).get_columns("categories")}
+    if "file_count" not in existing_columns:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE categories ADD COLUMN file_count INTEGER NOT NULL DEFAULT 0"
+            ))
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def sync_category_file_counts():
+    """Recompute the denormalized categories.file_count column from the files table"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE categories SET file_count = "
+            "(SELECT COUNT(*) FROM files "
+            "WHERE files.category_id = categories.id AND files.status != 'deleting')"
+        ))
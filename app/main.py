@@ -1,10 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from app.config import settings
-from app.database import init_db
+from app.database import init_db, sync_category_file_counts
 from app.api import categories, files, search
+from app.services.vector_store import vector_store_service
 from loguru import logger
 import sys
+import xxhash
 
 # Configure logging
 logger.remove()
@@ -20,7 +23,8 @@ app = FastAPI(
     version=settings.API_VERSION,
     description="GenAI File Search API with Gemini 2.5 Pro and Vertex AI",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -32,6 +36,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def etag_middleware(request: Request, call_next):
+    """Tag GET responses with an ETag and answer 304 when the client copy is current"""
+    response = await call_next(request)
+    if request.method != "GET" or response.status_code != 200:
+        return response
+    
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = f'"{xxhash.xxh64(body).hexdigest()}"'
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key not in ("content-length", "content-type")
+        }
+        headers["ETag"] = etag
+        return Response(status_code=304, headers=headers)
+    
+    headers = dict(response.headers)
+    headers["ETag"] = etag
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers=headers,
+        media_type=response.media_type
+    )
+
 # Include routers
 app.include_router(categories.router)
 app.include_router(files.router)
@@ -42,7 +74,9 @@ async def startup_event():
     """Initialize database on startup"""
     logger.info("Starting GenAI File Search API...")
     init_db()
+    sync_category_file_counts()
     logger.info("Database initialized")
+    vector_store_service.migrate_legacy_collection()
     logger.info(f"API running on http://{settings.API_HOST}:{settings.API_PORT}")
 
 @app.get("/")
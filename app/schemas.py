@@ -12,7 +12,7 @@ class CategoryResponse(BaseModel):
     name: str
     description: Optional[str]
     created_at: datetime
-    file_count: int = 0
+    file_count: int
     
     class Config:
         from_attributes = True
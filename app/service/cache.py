@@ -0,0 +1,77 @@
+import redis.asyncio as redis
+import numpy as np
+import xxhash
+import json
+from typing import List, Dict, Optional
+from app.config import settings
+from loguru import logger
+
+class CacheService:
+    """Redis cache for query embeddings and generated answers"""
+
+    def __init__(self):
+        self.client = redis.from_url(settings.REDIS_URL)
+        self.ttl = settings.QUERY_CACHE_TTL_SECONDS
+
+    def _embedding_key(self, text: str) -> str:
+        """Build the cache key for a query embedding"""
+        digest = xxhash.xxh64(text.encode("utf-8")).hexdigest()
+        return f"emb:{settings.EMBEDDING_MODEL}:{digest}"
+
+    def answer_key(self, kind: str, *parts) -> str:
+        """
+        Build the cache key for a generated answer
+
+        Args:
+            kind: Endpoint the answer belongs to
+            parts: Request fields and data version the answer depends on
+
+        Returns:
+            Cache key
+        """
+        digest = xxhash.xxh64("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+        return f"ans:{settings.GEMINI_MODEL}:{kind}:{digest}"
+
+    async def get_embedding(self, text: str) -> Optional[List[float]]:
+        """Get a cached query embedding, or None on a miss"""
+        try:
+            raw = await self.client.get(self._embedding_key(text))
+        except Exception as e:
+            logger.warning(f"Error reading embedding cache: {e}")
+            return None
+
+        if raw is None:
+            return None
+        return np.frombuffer(raw, dtype=np.float32).tolist()
+
+    async def set_embedding(self, text: str, embedding: List[float]):
+        """Cache a query embedding as packed float32"""
+        try:
+            await self.client.set(
+                self._embedding_key(text),
+                np.asarray(embedding, dtype=np.float32).tobytes(),
+                ex=self.ttl
+            )
+        except Exception as e:
+            logger.warning(f"Error writing embedding cache: {e}")
+
+    async def get_json(self, key: str) -> Optional[Dict]:
+        """Get a cached JSON payload, or None on a miss"""
+        try:
+            raw = await self.client.get(key)
+        except Exception as e:
+            logger.warning(f"Error reading answer cache: {e}")
+            return None
+
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set_json(self, key: str, value: Dict):
+        """Cache a JSON payload"""
+        try:
+            await self.client.set(key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Error writing answer cache: {e}")
+
+cache_service = CacheService()
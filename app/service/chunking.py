@@ -1,7 +1,16 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from app.config import settings
 import tiktoken
+import os
+
+# Approximate characters per cl100k_base token, used to size character-based splits
+CHARS_PER_TOKEN = 4
+
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+# tiktoken encodes batches on a native thread pool outside the GIL
+ENCODE_THREADS = os.cpu_count() or 1
 
 class ChunkingService:
     def __init__(self):
@@ -9,17 +18,44 @@ class ChunkingService:
         self.chunk_overlap = settings.CHUNK_OVERLAP
         self.encoding = tiktoken.get_encoding("cl100k_base")
         
+        # Split on characters so the splitter does not tokenize every candidate piece
         self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size * CHARS_PER_TOKEN,
+            chunk_overlap=self.chunk_overlap * CHARS_PER_TOKEN,
+            length_function=len,
+            separators=SEPARATORS
+        )
+        
+        # Exact token-based splitter, only used for chunks that overshoot chunk_size
+        self.token_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             length_function=self._token_length,
-            separators=["\n\n", "\n", ". ", " ", ""]
+            separators=SEPARATORS
         )
     
     def _token_length(self, text: str) -> int:
         """Calculate token length using tiktoken"""
         return len(self.encoding.encode(text))
     
+    def _token_counts(self, texts: List[str]) -> List[int]:
+        """Calculate token lengths for many texts in one tiktoken call"""
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, num_threads=ENCODE_THREADS)]
+    
+    def _enforce_token_limit(self, chunks: List[str], token_counts: List[int]) -> Tuple[List[str], List[int]]:
+        """Re-split chunks whose token count exceeds chunk_size"""
+        result_chunks = []
+        result_counts = []
+        for chunk, token_count in zip(chunks, token_counts):
+            if token_count <= self.chunk_size:
+                result_chunks.append(chunk)
+                result_counts.append(token_count)
+            else:
+                pieces = self.token_splitter.split_text(chunk)
+                result_chunks.extend(pieces)
+                result_counts.extend(self._token_counts(pieces))
+        return result_chunks, result_counts
+    
     def chunk_text(self, text: str, metadata: Dict = None) -> List[Dict]:
         """
         Split text into chunks with metadata
@@ -35,13 +71,20 @@ class ChunkingService:
             return []
         
         chunks = self.text_splitter.split_text(text)
+        return self._build_chunks(chunks, self._token_counts(chunks), metadata)
+    
+    def _build_chunks(self, chunks: List[str], token_counts: List[int], metadata: Dict = None) -> List[Dict]:
+        """Turn split text and its token counts into chunk dictionaries"""
+        # Character-based sizing can overshoot on token-dense text
+        if any(token_count > self.chunk_size for token_count in token_counts):
+            chunks, token_counts = self._enforce_token_limit(chunks, token_counts)
         
         result = []
-        for idx, chunk in enumerate(chunks):
+        for idx, (chunk, token_count) in enumerate(zip(chunks, token_counts)):
             chunk_dict = {
                 "chunk_index": idx,
                 "text": chunk,
-                "token_count": self._token_length(chunk)
+                "token_count": token_count
             }
             
             if metadata:
@@ -61,14 +104,22 @@ class ChunkingService:
         Returns:
             List of all chunks with document metadata
         """
-        all_chunks = []
-        
+        # Split every document first so token counting runs as a single batch
+        splits = []
         for doc in documents:
             text = doc.get("text", "")
-            doc_metadata = doc.get("metadata", {})
-            
-            chunks = self.chunk_text(text, doc_metadata)
-            all_chunks.extend(chunks)
+            if not text or not text.strip():
+                continue
+            splits.append((self.text_splitter.split_text(text), doc.get("metadata", {})))
+        
+        token_counts = self._token_counts([chunk for chunks, _ in splits for chunk in chunks])
+        
+        all_chunks = []
+        offset = 0
+        for chunks, doc_metadata in splits:
+            doc_token_counts = token_counts[offset:offset + len(chunks)]
+            offset += len(chunks)
+            all_chunks.extend(self._build_chunks(chunks, doc_token_counts, doc_metadata))
         
         return all_chunks
 
@@ -1,19 +1,89 @@
 import os
 from typing import List, Dict
-import PyPDF2
+import pypdfium2
 from docx import Document
-import openpyxl
+from python_calamine import CalamineWorkbook
 from pptx import Presentation
-from PIL import Image
+from PIL import Image, ImageSequence
 import pytesseract
-import pandas as pd
-import json
+import pyarrow as pa
+import pyarrow.csv as pv
+import orjson
+import ijson
+import io
+import csv
+import mmap
 import xml.etree.ElementTree as ET
 from loguru import logger
 
+# Files extracting fewer non-whitespace characters than this yield no documents
+MIN_TEXT_CHARS = 4
+
+# Bytes of CSV parsed per Arrow record batch
+CSV_BLOCK_SIZE = 8 << 20
+
+# JSON files above this size are flattened from a parser event stream
+JSON_STREAM_MIN_BYTES = 20 << 20
+_JSON_SCALAR_EVENTS = frozenset({"string", "number", "boolean", "null"})
+
+# LSTM engine, single uniform block of text
+TESSERACT_CONFIG = "--oem 1 --psm 6"
+
+def _ocr_grayscale(image: Image.Image) -> str:
+    """OCR an image after converting it to 8-bit grayscale"""
+    if image.mode != "L":
+        image = image.convert("L")
+    return pytesseract.image_to_string(image, config=TESSERACT_CONFIG)
+
+def _read_text(file_path: str) -> str:
+    """Decode a UTF-8 file straight from a memory map, skipping the bytes copy"""
+    if os.path.getsize(file_path) == 0:
+        return ""
+    with open(file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = str(mm, 'utf-8', 'ignore')
+    # Match text-mode universal newlines, so CRLF paragraphs still split on "\n\n"
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+def _flatten_json(value, path: str, out: io.StringIO):
+    """Write a 'path.to.key: value' line for every scalar in a JSON tree"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten_json(item, f"{path}.{key}" if path else key, out)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            _flatten_json(item, f"{path}.{index}" if path else str(index), out)
+    elif path:
+        out.write(f"{path}: {value}\n")
+    else:
+        out.write(f"{value}\n")
+
 class FileProcessor:
     """Process different file types and extract text"""
     
+    def __init__(self):
+        self._dispatch = {
+            ".pdf": self._process_pdf,
+            ".doc": self._process_docx,
+            ".docx": self._process_docx,
+            ".xls": self._process_excel,
+            ".xlsx": self._process_excel,
+            ".ppt": self._process_pptx,
+            ".pptx": self._process_pptx,
+            ".txt": self._process_txt,
+            ".csv": self._process_csv,
+            ".jpg": self._process_image,
+            ".jpeg": self._process_image,
+            ".png": self._process_image,
+            ".bmp": self._process_image,
+            ".tiff": self._process_image,
+            ".json": self._process_json,
+            ".xml": self._process_xml,
+            ".sql": self._process_sql,
+        }
+    
     def process_file(self, file_path: str, file_type: str) -> List[Dict]:
         """
         Process file and return documents with text and metadata
@@ -26,28 +96,18 @@ class FileProcessor:
             List of document dictionaries
         """
         try:
-            if file_type == ".pdf":
-                return self._process_pdf(file_path)
-            elif file_type in [".doc", ".docx"]:
-                return self._process_docx(file_path)
-            elif file_type in [".xls", ".xlsx"]:
-                return self._process_excel(file_path)
-            elif file_type in [".ppt", ".pptx"]:
-                return self._process_pptx(file_path)
-            elif file_type == ".txt":
-                return self._process_txt(file_path)
-            elif file_type == ".csv":
-                return self._process_csv(file_path)
-            elif file_type in [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]:
-                return self._process_image(file_path)
-            elif file_type == ".json":
-                return self._process_json(file_path)
-            elif file_type == ".xml":
-                return self._process_xml(file_path)
-            elif file_type == ".sql":
-                return self._process_sql(file_path)
-            else:
+            handler = self._dispatch.get(file_type)
+            if handler is None:
                 raise ValueError(f"Unsupported file type: {file_type}")
+            documents = handler(file_path)
+            
+            # Near-empty extractions are not worth chunking and embedding
+            remaining = MIN_TEXT_CHARS
+            for document in documents:
+                remaining -= len(document["text"].strip())
+                if remaining <= 0:
+                    return documents
+            return []
         except Exception as e:
             logger.error(f"Error processing file {file_path}: {e}")
             raise
@@ -55,34 +115,46 @@ class FileProcessor:
     def _process_pdf(self, file_path: str) -> List[Dict]:
         """Extract text from PDF"""
         documents = []
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num, page in enumerate(pdf_reader.pages):
-                text = page.extract_text()
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            for page_num in range(len(pdf)):
+                page = pdf[page_num]
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+                page.close()
                 if text.strip():
                     documents.append({
                         "text": text,
                         "metadata": {"page_number": page_num + 1}
                     })
+        finally:
+            pdf.close()
         return documents
     
     def _process_docx(self, file_path: str) -> List[Dict]:
         """Extract text from DOCX"""
         doc = Document(file_path)
-        text = "\n\n".join([para.text for para in doc.paragraphs if para.text.strip()])
+        # para.text is rebuilt from runs on every access, so read and strip it once
+        paragraphs = []
+        for para in doc.paragraphs:
+            text = para.text.strip()
+            if text:
+                paragraphs.append(text)
+        text = "\n\n".join(paragraphs)
         return [{"text": text, "metadata": {}}]
     
     def _process_excel(self, file_path: str) -> List[Dict]:
         """Extract text from Excel"""
         documents = []
-        workbook = openpyxl.load_workbook(file_path, data_only=True)
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
+        workbook = CalamineWorkbook.from_path(file_path)
+        for sheet_name in workbook.sheet_names:
+            sheet = workbook.get_sheet_by_name(sheet_name)
             rows = []
-            for row in sheet.iter_rows(values_only=True):
-                row_text = " | ".join([str(cell) if cell is not None else "" for cell in row])
-                if row_text.strip():
-                    rows.append(row_text)
+            for row in sheet.to_python():
+                # Skip empty rows before building their join string
+                if any(cell is not None and cell != "" for cell in row):
+                    rows.append(" | ".join([str(cell) if cell is not None else "" for cell in row]))
             if rows:
                 documents.append({
                     "text": "\n".join(rows),
@@ -97,8 +169,10 @@ class FileProcessor:
         for slide_num, slide in enumerate(prs.slides):
             text_parts = []
             for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text.strip():
-                    text_parts.append(shape.text)
+                # shape.text is computed from the text frame, so read and strip it once
+                text = getattr(shape, "text", "").strip()
+                if text:
+                    text_parts.append(text)
             if text_parts:
                 documents.append({
                     "text": "\n".join(text_parts),
@@ -108,40 +182,105 @@ class FileProcessor:
     
     def _process_txt(self, file_path: str) -> List[Dict]:
         """Extract text from TXT"""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-            text = file.read()
-        return [{"text": text, "metadata": {}}]
+        return [{"text": _read_text(file_path), "metadata": {}}]
     
     def _process_csv(self, file_path: str) -> List[Dict]:
         """Extract text from CSV"""
-        df = pd.read_csv(file_path)
-        text = df.to_string(index=False)
-        return [{"text": text, "metadata": {"rows": len(df), "columns": len(df.columns)}}]
+        with open(file_path, newline='', encoding='utf-8-sig', errors='ignore') as file:
+            header = next(csv.reader(file), None)
+        if not header:
+            return []
+        
+        # Arrow infers column types from the first block only, so a later block
+        # with e.g. text in a numeric column would fail; every cell is text here
+        reader = pv.open_csv(
+            file_path,
+            read_options=pv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            # Quoted fields may span lines, e.g. exported addresses and descriptions
+            parse_options=pv.ParseOptions(newlines_in_values=True),
+            convert_options=pv.ConvertOptions(column_types={name: pa.string() for name in header})
+        )
+        column_names = reader.schema.names
+        lines = [" | ".join(column_names)]
+        row_count = 0
+        
+        # Stream record batches instead of materializing the whole table
+        for batch in reader:
+            columns = [
+                ["" if value is None else str(value) for value in column.to_pylist()]
+                for column in batch.columns
+            ]
+            lines.extend(" | ".join(row) for row in zip(*columns))
+            row_count += batch.num_rows
+        
+        if not row_count:
+            return []
+        
+        text = "\n".join(lines)
+        return [{"text": text, "metadata": {"rows": row_count, "columns": len(column_names)}}]
     
     def _process_image(self, file_path: str) -> List[Dict]:
         """Extract text from image using OCR"""
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
-        return [{"text": text, "metadata": {}}]
+        with Image.open(file_path) as image:
+            frame_count = getattr(image, "n_frames", 1)
+            if frame_count == 1:
+                image.load()
+                return [{"text": _ocr_grayscale(image), "metadata": {}}]
+            
+            texts = [_ocr_grayscale(frame) for frame in ImageSequence.Iterator(image)]
+        
+        # Multi-page TIFFs yield one document per page
+        return [
+            {"text": text, "metadata": {"page_number": page_num + 1}}
+            for page_num, text in enumerate(texts)
+            if text.strip()
+        ]
     
     def _process_json(self, file_path: str) -> List[Dict]:
         """Extract text from JSON"""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        text = json.dumps(data, indent=2)
-        return [{"text": text, "metadata": {}}]
+        out = io.StringIO()
+        with open(file_path, 'rb') as file:
+            if os.path.getsize(file_path) > JSON_STREAM_MIN_BYTES:
+                # Never materialize the tree; ijson paths name array items "item"
+                for prefix, event, value in ijson.parse(file, use_float=True):
+                    if event in _JSON_SCALAR_EVENTS:
+                        out.write(f"{prefix}: {value}\n" if prefix else f"{value}\n")
+            else:
+                _flatten_json(orjson.loads(file.read()), "", out)
+        return [{"text": out.getvalue(), "metadata": {}}]
     
     def _process_xml(self, file_path: str) -> List[Dict]:
         """Extract text from XML"""
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        text = ET.tostring(root, encoding='unicode', method='text')
-        return [{"text": text, "metadata": {}}]
+        out = io.StringIO()
+        depth = 0
+        root = previous = None
+        for event, elem in ET.iterparse(file_path, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            
+            depth -= 1
+            if depth > 1:
+                continue
+            
+            # Text before this element: the root's own text, or the previous
+            # top-level element's tail, which is only parsed once past it
+            if previous is None:
+                out.write(root.text or "")
+            else:
+                out.write(previous.tail or "")
+                # Drop the finished subtree to keep memory flat
+                root.remove(previous)
+            
+            if depth == 1:
+                out.write("".join(elem.itertext()))
+                previous = elem
+        return [{"text": out.getvalue(), "metadata": {}}]
     
     def _process_sql(self, file_path: str) -> List[Dict]:
         """Extract text from SQL"""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-            text = file.read()
-        return [{"text": text, "metadata": {}}]
+        return [{"text": _read_text(file_path), "metadata": {}}]
 
 file_processor = FileProcessor()
@@ -1,10 +1,24 @@
 import chromadb
+from chromadb.api.models.Collection import Collection
 from chromadb.config import Settings as ChromaSettings
-from typing import List, Dict, Optional
+from chromadb.db.base import UniqueConstraintError
+from typing import List, Dict, Optional, Union
 from app.config import settings
 from loguru import logger
+import numpy as np
 import uuid
 
+# Chunks per collection.add call; Chroma inserts fastest in the 50-250 range
+ADD_BATCH_SIZE = 200
+
+# HNSW index parameters; only applied when a collection is created
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 24,
+    "hnsw:construction_ef": 128,
+    "hnsw:search_ef": 100
+}
+
 class VectorStoreService:
     """Manage ChromaDB operations for vector storage and retrieval"""
     
@@ -13,111 +27,221 @@ class VectorStoreService:
             path=settings.CHROMA_PERSIST_DIRECTORY,
             settings=ChromaSettings(anonymized_telemetry=False)
         )
-        self._ensure_collection()
+        # One collection per category, so category reads never scan other tenants
+        self._collections: Dict[int, Collection] = {}
+    
+    def _collection_name(self, category_id: int) -> str:
+        """Name of the collection holding a category's chunks"""
+        return f"{settings.CHROMA_COLLECTION_NAME}_{category_id}"
     
-    def _ensure_collection(self):
-        """Ensure the collection exists"""
+    def _get_collection(self, category_id: int, create: bool = True) -> Optional[Collection]:
+        """Get a category's collection, creating it if requested"""
+        collection = self._collections.get(category_id)
+        if collection is not None:
+            return collection
+        
+        name = self._collection_name(category_id)
+        if create:
+            # Every category collection shares COLLECTION_METADATA, so the
+            # metadata get_or_create writes on an existing collection never changes
+            try:
+                collection = self.client.get_or_create_collection(name=name, metadata=COLLECTION_METADATA)
+            except UniqueConstraintError:
+                # Another worker created it between Chroma's lookup and insert
+                collection = self.client.get_collection(name=name)
+        else:
+            try:
+                collection = self.client.get_collection(name=name)
+            except ValueError:
+                return None
+        
+        self._collections[category_id] = collection
+        return collection
+    
+    def migrate_legacy_collection(self):
+        """
+        Move chunks from the old shared collection into per-category collections
+        
+        Run once at API startup rather than on import, so worker processes never
+        race it; a failed run is logged and resumes on the next startup.
+        """
         try:
-            self.collection = self.client.get_collection(
-                name=settings.CHROMA_COLLECTION_NAME
-            )
-        except:
-            self.collection = self.client.create_collection(
-                name=settings.CHROMA_COLLECTION_NAME,
-                metadata={"hnsw:space": "cosine"}
+            legacy = self.client.get_collection(name=settings.CHROMA_COLLECTION_NAME)
+        except ValueError:
+            return
+        
+        try:
+            self._copy_legacy_collection(legacy)
+        except Exception as e:
+            logger.error(f"Error migrating legacy collection: {e}")
+    
+    def _copy_legacy_collection(self, legacy: Collection):
+        """Copy the legacy collection in batches, then drop it"""
+        logger.info(f"Migrating {legacy.count()} chunks to per-category collections")
+        while True:
+            results = legacy.get(
+                limit=ADD_BATCH_SIZE,
+                include=["documents", "metadatas", "embeddings"]
             )
+            if not results['ids']:
+                break
+            
+            batches: Dict[int, Dict[str, list]] = {}
+            for chunk_id, text, metadata, embedding in zip(
+                results['ids'], results['documents'], results['metadatas'], results['embeddings']
+            ):
+                batch = batches.setdefault(
+                    metadata["category_id"],
+                    {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+                )
+                batch["ids"].append(chunk_id)
+                batch["documents"].append(text)
+                batch["metadatas"].append(metadata)
+                batch["embeddings"].append(embedding)
+            
+            for category_id, batch in batches.items():
+                # upsert keeps a concurrent migration from another process harmless
+                self._get_collection(category_id).upsert(**batch)
+            legacy.delete(ids=results['ids'])
+        
+        try:
+            self.client.delete_collection(name=settings.CHROMA_COLLECTION_NAME)
+        except ValueError:
+            pass
+        logger.info("Migrated legacy collection")
     
     def add_chunks(
         self,
+        category_id: int,
         chunk_ids: List[str],
         texts: List[str],
-        embeddings: List[List[float]],
+        embeddings: Union[np.ndarray, List[List[float]]],
         metadatas: List[Dict]
     ) -> bool:
         """
-        Add chunks to vector store
+        Add chunks to vector store in batches of ADD_BATCH_SIZE
         
         Args:
+            category_id: Category the chunks belong to
             chunk_ids: List of unique chunk IDs
             texts: List of chunk texts
-            embeddings: List of embedding vectors
+            embeddings: Embedding vectors, as a 2-D array or list of lists
             metadatas: List of metadata dictionaries
         
         Returns:
             Success status
         """
+        added = 0
         try:
-            self.collection.add(
-                ids=chunk_ids,
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=metadatas
-            )
+            collection = self._get_collection(category_id)
+            
+            for start in range(0, len(chunk_ids), ADD_BATCH_SIZE):
+                end = start + ADD_BATCH_SIZE
+                batch_embeddings = embeddings[start:end]
+                if isinstance(batch_embeddings, np.ndarray):
+                    # Chroma 0.4 validates embeddings as lists, so convert per batch
+                    batch_embeddings = batch_embeddings.tolist()
+                collection.add(
+                    ids=chunk_ids[start:end],
+                    documents=texts[start:end],
+                    embeddings=batch_embeddings,
+                    metadatas=metadatas[start:end]
+                )
+                added = end
             logger.info(f"Added {len(chunk_ids)} chunks to vector store")
             return True
         except Exception as e:
             logger.error(f"Error adding chunks to vector store: {e}")
+            # Remove the batches that did go in, so a failed file leaves no vectors
+            if added:
+                try:
+                    collection.delete(ids=chunk_ids[:added])
+                except Exception as delete_error:
+                    logger.error(f"Error removing partially added chunks: {delete_error}")
+            # The cached handle may point at a collection dropped by another process
+            self._collections.pop(category_id, None)
             return False
     
     def search(
         self,
         query_embedding: List[float],
         category_id: int,
-        top_k: int = 5
+        top_k: int = 5,
+        ef_search: Optional[int] = None
     ) -> List[Dict]:
         """
         Search for similar chunks
         
         Args:
             query_embedding: Query embedding vector
-            category_id: Filter by category ID
+            category_id: Category to search in
             top_k: Number of results to return
+            ef_search: Candidate list size for the HNSW search; only values above
+                the collection's hnsw:search_ef trade latency for recall
         
         Returns:
             List of matching chunks with metadata
         """
         try:
-            results = self.collection.query(
+            collection = self._get_collection(category_id, create=False)
+            if collection is None:
+                return []
+            
+            # HNSW explores max(search_ef, n_results) candidates, so over-fetch
+            # and keep the top_k best to widen the search for this query only;
+            # anything up to the collection's search_ef is explored already
+            n_results = top_k
+            if ef_search and ef_search > COLLECTION_METADATA["hnsw:search_ef"]:
+                n_results = max(top_k, ef_search)
+            results = collection.query(
                 query_embeddings=[query_embedding],
-                n_results=top_k,
-                where={"category_id": category_id}
+                n_results=n_results,
+                include=["documents", "metadatas", "distances"]
             )
             
             if not results or not results['ids'] or not results['ids'][0]:
                 return []
             
-            # Format results
-            formatted_results = []
-            for i in range(len(results['ids'][0])):
-                formatted_results.append({
-                    "chunk_id": results['ids'][0][i],
-                    "text": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i],
-                    "distance": results['distances'][0][i] if 'distances' in results else 0.0
-                })
-            
-            return formatted_results
+            return [
+                {
+                    "chunk_id": chunk_id,
+                    "text": text,
+                    "metadata": metadata,
+                    "distance": distance
+                }
+                for chunk_id, text, metadata, distance in zip(
+                    results['ids'][0][:top_k],
+                    results['documents'][0],
+                    results['metadatas'][0],
+                    results['distances'][0]
+                )
+            ]
         except Exception as e:
+            self._collections.pop(category_id, None)
             logger.error(f"Error searching vector store: {e}")
             return []
     
-    def delete_by_file_id(self, file_id: int) -> bool:
+    def delete_by_file_id(self, category_id: int, file_id: int) -> bool:
         """
         Delete all chunks for a specific file
         
         Args:
+            category_id: Category the file belongs to
             file_id: File ID to delete chunks for
         
         Returns:
             Success status
         """
         try:
-            self.collection.delete(
-                where={"file_id": file_id}
-            )
+            collection = self._get_collection(category_id, create=False)
+            if collection is not None:
+                collection.delete(
+                    where={"file_id": file_id}
+                )
             logger.info(f"Deleted chunks for file_id: {file_id}")
             return True
         except Exception as e:
+            self._collections.pop(category_id, None)
             logger.error(f"Error deleting chunks: {e}")
             return False
     
@@ -131,29 +255,37 @@ class VectorStoreService:
         Returns:
             Success status
         """
+        self._collections.pop(category_id, None)
         try:
-            self.collection.delete(
-                where={"category_id": category_id}
-            )
-            logger.info(f"Deleted chunks for category_id: {category_id}")
-            return True
+            # Dropping the collection is O(1) instead of a filtered delete
+            self.client.delete_collection(name=self._collection_name(category_id))
+        except ValueError:
+            pass
         except Exception as e:
             logger.error(f"Error deleting chunks: {e}")
             return False
+        
+        logger.info(f"Deleted chunks for category_id: {category_id}")
+        return True
     
-    def get_all_chunks_by_category(self, category_id: int) -> List[Dict]:
+    def get_all_chunks_by_category(self, category_id: int, limit: Optional[int] = None) -> List[Dict]:
         """
         Get all chunks for a category
         
         Args:
             category_id: Category ID
+            limit: Maximum number of chunks to return (all if None)
         
         Returns:
             List of chunks
         """
         try:
-            results = self.collection.get(
-                where={"category_id": category_id}
+            collection = self._get_collection(category_id, create=False)
+            if collection is None:
+                return []
+            
+            results = collection.get(
+                limit=limit
             )
             
             if not results or not results['ids']:
@@ -169,6 +301,7 @@ class VectorStoreService:
             
             return formatted_results
         except Exception as e:
+            self._collections.pop(category_id, None)
             logger.error(f"Error getting chunks: {e}")
             return []
 
@@ -1,4 +1,5 @@
 from celery import Celery
+from kombu.serialization import register
 from app.config import settings
 from app.database import SessionLocal
 from app.models import File, Chunk
@@ -8,8 +9,24 @@ from app.services.embeddings import embeddings_service
 from app.services.vector_store import vector_store_service
 from loguru import logger
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import os
+import queue
+import threading
 import uuid
 
+# orjson codec for task messages and results; registered under the JSON
+# content type so messages stay readable by plain JSON consumers
+register(
+    "orjson",
+    orjson.dumps,
+    orjson.loads,
+    content_type="application/json",
+    content_encoding="utf-8"
+)
+
 # Initialize Celery
 celery_app = Celery(
     "genai_file_search",
@@ -18,17 +35,247 @@ celery_app = Celery(
 )
 
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    task_serializer='orjson',
+    accept_content=['orjson', 'json'],
+    result_serializer='orjson',
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
     task_time_limit=3600,  # 1 hour
-    worker_prefetch_multiplier=1,
-    worker_max_tasks_per_child=50,
+    task_acks_late=True,
+    worker_prefetch_multiplier=4,  # tasks mostly wait on the embedding API
+    # Redis redelivers unacked tasks after visibility_timeout; a prefetched task
+    # can queue behind four running ones, so outlast all of them plus its own run
+    broker_transport_options={"visibility_timeout": 6 * 3600},
+    worker_max_tasks_per_child=500,  # keep the warm Chroma client across tasks
 )
 
+# Batch pipeline: chunks embedded per call, and chunked files buffered ahead of it
+EMBED_BATCH_SIZE = 256
+PIPELINE_QUEUE_SIZE = 4
+_PIPELINE_DONE = object()
+
+def _start_files(file_ids: List[int]) -> List[Dict]:
+    """
+    Mark files as processing in a short-lived session
+    
+    Args:
+        file_ids: Database file IDs
+    
+    Returns:
+        Plain snapshots of the files found, so no session is held afterwards
+    """
+    with SessionLocal() as db:
+        # Files tombstoned while their task was queued are left to the cleanup
+        # task, and a redelivered task does not redo a file that already finished
+        files = db.query(File).filter(
+            File.id.in_(file_ids),
+            File.status.notin_(("deleting", "completed"))
+        ).all()
+        snapshots = [
+            {
+                "id": file.id,
+                "category_id": file.category_id,
+                "file_path": file.file_path,
+                "file_type": file.file_type,
+                "original_filename": file.original_filename,
+                # A redelivered task may find chunks from an interrupted run
+                "retry": file.status != "pending"
+            }
+            for file in files
+        ]
+        for file in files:
+            file.status = "processing"
+        db.commit()
+    
+    return snapshots
+
+def _fail_file(file_id: int, message: str):
+    """Mark a file as failed with an error message"""
+    with SessionLocal() as db:
+        db.query(File).filter(
+            File.id == file_id,
+            File.status.notin_(("deleting", "completed"))
+        ).update(
+            {"status": "failed", "error_message": message},
+            synchronize_session=False
+        )
+        db.commit()
+
+def _extract_chunks(file: Dict) -> Tuple[List[Dict], Optional[Dict]]:
+    """
+    Extract and chunk a file's text
+    
+    Args:
+        file: File snapshot from _start_files
+    
+    Returns:
+        Chunks, and an error result if the file was marked failed
+    """
+    # Step 1: Extract text from file
+    documents = file_processor.process_file(file["file_path"], file["file_type"])
+    
+    if not documents:
+        _fail_file(file["id"], "No text extracted from file")
+        return [], {"status": "error", "file_id": file["id"], "message": "No text extracted"}
+    
+    logger.info(f"Extracted {len(documents)} documents from file")
+    
+    # Step 2: Chunk documents
+    all_chunks = chunking_service.chunk_documents(documents)
+    
+    if not all_chunks:
+        _fail_file(file["id"], "No chunks created")
+        return [], {"status": "error", "file_id": file["id"], "message": "No chunks created"}
+    
+    logger.info(f"Created {len(all_chunks)} chunks")
+    
+    return all_chunks, None
+
+def _build_chunk_payload(file: Dict, all_chunks: List[Dict]) -> Dict[str, list]:
+    """Build texts, IDs, vector metadata and DB rows for a file's chunks in one pass"""
+    chunk_ids, chunk_texts, chunk_metadatas, chunk_rows = [], [], [], []
+    file_id = file["id"]
+    category_id = file["category_id"]
+    # SQLite can hand a deleted file's id to the next file, so one random seed
+    # per run keeps its IDs clear of any vectors the old file left behind
+    seed = uuid.uuid4().hex[:8]
+    for idx, chunk in enumerate(all_chunks):
+        # Zero-padding makes lexicographic order match insertion order for
+        # sequential index writes
+        chunk_id = f"file_{file_id:010d}_{seed}_chunk_{idx:08d}"
+        text = chunk["text"]
+        page_number = chunk.get("page_number")
+        chunk_ids.append(chunk_id)
+        chunk_texts.append(text)
+        chunk_metadatas.append({
+            "file_id": file_id,
+            "category_id": category_id,
+            "chunk_index": idx,
+            "page_number": page_number or 0
+        })
+        chunk_rows.append({
+            "file_id": file_id,
+            "chunk_id": chunk_id,
+            "chunk_text": text,
+            "chunk_index": idx,
+            "page_number": page_number
+        })
+    
+    return {
+        "chunk_ids": chunk_ids,
+        "chunk_texts": chunk_texts,
+        "chunk_metadatas": chunk_metadatas,
+        "chunk_rows": chunk_rows
+    }
+
+def _store_chunks(file: Dict, payload: Dict[str, list], embeddings) -> Dict:
+    """
+    Write a file's chunks to the vector store, then the database
+    
+    Args:
+        file: File snapshot from _start_files
+        payload: Output of _build_chunk_payload
+        embeddings: One embedding per chunk
+    
+    Returns:
+        Processing result
+    """
+    file_id = file["id"]
+    total_chunks = len(payload["chunk_ids"])
+    
+    if file["retry"]:
+        # Clear anything an earlier run left behind, so chunks are not duplicated
+        vector_store_service.delete_by_file_id(file["category_id"], file_id)
+    
+    # Step 4: Add to vector store first, so no database write lock is held
+    # across the slow Chroma insert
+    success = vector_store_service.add_chunks(
+        category_id=file["category_id"],
+        chunk_ids=payload["chunk_ids"],
+        texts=payload["chunk_texts"],
+        embeddings=embeddings,
+        metadatas=payload["chunk_metadatas"]
+    )
+    
+    if not success:
+        _fail_file(file_id, "Failed to add to vector store")
+        return {"status": "error", "file_id": file_id, "message": "Failed to add to vector store"}
+    
+    # Step 5: Insert all chunk rows in one executemany and update the file
+    # status in a single short transaction
+    try:
+        with SessionLocal() as db:
+            if file["retry"]:
+                db.query(Chunk).filter(Chunk.file_id == file_id).delete(synchronize_session=False)
+            db.bulk_insert_mappings(Chunk, payload["chunk_rows"])
+            # Unless the file was deleted while it was processed
+            updated = db.query(File).filter(File.id == file_id, File.status != "deleting").update(
+                {
+                    "status": "completed",
+                    "total_chunks": total_chunks,
+                    "processed_at": datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+            if updated:
+                db.commit()
+    except Exception:
+        # Keep the vector store in step with the rolled-back chunk rows
+        vector_store_service.delete_by_file_id(file["category_id"], file_id)
+        raise
+    
+    if not updated:
+        # The cleanup task may already have run, so drop what was just written
+        vector_store_service.delete_by_file_id(file["category_id"], file_id)
+        logger.info(f"File {file_id} was deleted during processing; discarded its chunks")
+        return {"status": "error", "file_id": file_id, "message": "File was deleted"}
+    
+    logger.info(f"Successfully processed file {file_id} with {total_chunks} chunks")
+    
+    return {
+        "status": "success",
+        "file_id": file_id,
+        "total_chunks": total_chunks
+    }
+
+def _produce_payloads(files: List[Dict], work: queue.Queue, stop: threading.Event, results: List[Dict]):
+    """Extract and chunk files onto the pipeline queue; one bad file does not fail the batch"""
+    try:
+        for file in files:
+            if stop.is_set():
+                break
+            try:
+                all_chunks, error = _extract_chunks(file)
+            except Exception as e:
+                logger.error(f"Error processing file {file['id']}: {e}")
+                _fail_file(file["id"], str(e))
+                results.append({"status": "error", "file_id": file["id"], "message": str(e)})
+                continue
+            if error:
+                results.append(error)
+                continue
+            work.put((file, _build_chunk_payload(file, all_chunks)))
+    finally:
+        work.put(_PIPELINE_DONE)
+
+def _embed_and_store(group: List[Tuple[Dict, Dict[str, list]]]) -> List[Dict]:
+    """Embed a group of files' chunks in one call and store each file"""
+    # Step 3: Generate embeddings for every file's chunks in one call
+    all_texts = [text for _, payload in group for text in payload["chunk_texts"]]
+    embeddings = embeddings_service.generate_embeddings_batch(all_texts)
+    
+    logger.info(f"Generated {len(embeddings)} embeddings")
+    
+    # Split the embeddings back out per file
+    results = []
+    offset = 0
+    for file, payload in group:
+        count = len(payload["chunk_texts"])
+        results.append(_store_chunks(file, payload, embeddings[offset:offset + count]))
+        offset += count
+    return results
+
 @celery_app.task(bind=True, name="process_file")
 def process_file_task(self, file_id: int):
     """
@@ -40,124 +287,170 @@ def process_file_task(self, file_id: int):
     Returns:
         Processing result
     """
-    db = SessionLocal()
-    
     try:
-        # Get file from database
-        file = db.query(File).filter(File.id == file_id).first()
-        if not file:
+        # Sessions are opened only around DB work, never across extraction or
+        # embedding, so a long file does not pin a pooled connection
+        files = _start_files([file_id])
+        if not files:
             return {"status": "error", "message": "File not found"}
+        file = files[0]
         
-        # Update status
-        file.status = "processing"
-        db.commit()
+        logger.info(f"Processing file: {file['original_filename']} (ID: {file_id})")
         
-        logger.info(f"Processing file: {file.original_filename} (ID: {file_id})")
+        all_chunks, error = _extract_chunks(file)
+        if error:
+            return error
         
-        # Step 1: Extract text from file
-        documents = file_processor.process_file(file.file_path, file.file_type)
+        payload = _build_chunk_payload(file, all_chunks)
         
-        if not documents:
-            file.status = "failed"
-            file.error_message = "No text extracted from file"
-            db.commit()
-            return {"status": "error", "message": "No text extracted"}
+        # Step 3: Generate embeddings
+        embeddings = embeddings_service.generate_embeddings_batch(payload["chunk_texts"])
         
-        logger.info(f"Extracted {len(documents)} documents from file")
+        logger.info(f"Generated {len(embeddings)} embeddings")
         
-        # Step 2: Chunk documents
-        all_chunks = []
-        for doc in documents:
-            chunks = chunking_service.chunk_text(
-                doc["text"],
-                metadata=doc.get("metadata", {})
-            )
-            all_chunks.extend(chunks)
+        return _store_chunks(file, payload, embeddings)
         
-        if not all_chunks:
-            file.status = "failed"
-            file.error_message = "No chunks created"
-            db.commit()
-            return {"status": "error", "message": "No chunks created"}
+    except Exception as e:
+        logger.error(f"Error processing file {file_id}: {e}")
         
-        logger.info(f"Created {len(all_chunks)} chunks")
+        # Update file status
+        _fail_file(file_id, str(e))
         
-        # Step 3: Generate embeddings
-        chunk_texts = [chunk["text"] for chunk in all_chunks]
-        embeddings = embeddings_service.generate_embeddings_batch(chunk_texts)
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        SessionLocal.remove()
+
+@celery_app.task(bind=True, name="process_files_batch")
+def process_files_batch_task(self, file_ids: list):
+    """
+    Async task to process several uploaded files, embedding them in large batches
+    
+    Args:
+        file_ids: Database file IDs
+    
+    Returns:
+        Per-file processing results
+    """
+    try:
+        files = _start_files(file_ids)
+        found_ids = {file["id"] for file in files}
+        results = [
+            {"status": "error", "file_id": file_id, "message": "File not found"}
+            for file_id in file_ids if file_id not in found_ids
+        ]
         
-        logger.info(f"Generated {len(embeddings)} embeddings")
+        logger.info(f"Processing batch of {len(files)} files")
         
-        # Step 4: Store in database and vector store
-        chunk_ids = []
-        chunk_metadatas = []
-        
-        for idx, chunk in enumerate(all_chunks):
-            # Generate unique chunk ID
-            chunk_id = f"file_{file_id}_chunk_{idx}_{uuid.uuid4().hex[:8]}"
-            chunk_ids.append(chunk_id)
-            
-            # Create chunk in database
-            db_chunk = Chunk(
-                file_id=file_id,
-                chunk_id=chunk_id,
-                chunk_text=chunk["text"],
-                chunk_index=idx,
-                page_number=chunk.get("page_number")
-            )
-            db.add(db_chunk)
-            
-            # Prepare metadata for vector store
-            metadata = {
-                "file_id": file_id,
-                "category_id": file.category_id,
-                "chunk_index": idx,
-                "page_number": chunk.get("page_number", 0)
-            }
-            chunk_metadatas.append(metadata)
+        # A producer thread extracts and chunks the next files while this thread
+        # embeds and stores the ones already chunked
+        work = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        done = False
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            producer = executor.submit(_produce_payloads, files, work, stop, results)
+            try:
+                group, group_size = [], 0
+                while not done:
+                    item = work.get()
+                    done = item is _PIPELINE_DONE
+                    if not done:
+                        group.append(item)
+                        group_size += len(item[1]["chunk_texts"])
+                    if group and (done or group_size >= EMBED_BATCH_SIZE):
+                        results.extend(_embed_and_store(group))
+                        group, group_size = [], 0
+            except Exception:
+                # Unblock the producer so the executor can shut down
+                stop.set()
+                while not done:
+                    done = work.get() is _PIPELINE_DONE
+                raise
+            producer.result()
         
-        # Commit chunks to database
-        db.commit()
+        return {"status": "success", "results": results}
         
-        # Step 5: Add to vector store
-        success = vector_store_service.add_chunks(
-            chunk_ids=chunk_ids,
-            texts=chunk_texts,
-            embeddings=embeddings,
-            metadatas=chunk_metadatas
-        )
+    except Exception as e:
+        logger.error(f"Error processing file batch {file_ids}: {e}")
         
-        if not success:
-            file.status = "failed"
-            file.error_message = "Failed to add to vector store"
+        # Fail whatever had not finished when the batch broke
+        with SessionLocal() as db:
+            db.query(File).filter(File.id.in_(file_ids), File.status == "processing").update(
+                {"status": "failed", "error_message": str(e)},
+                synchronize_session=False
+            )
             db.commit()
-            return {"status": "error", "message": "Failed to add to vector store"}
         
-        # Update file status
-        file.status = "completed"
-        file.total_chunks = len(all_chunks)
-        file.processed_at = datetime.utcnow()
-        db.commit()
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        SessionLocal.remove()
+
+@celery_app.task(name="cleanup_file")
+def cleanup_file_task(file_id: int):
+    """
+    Async task to remove a file marked for deletion
+    
+    Args:
+        file_id: Database file ID
+    
+    Returns:
+        Cleanup result
+    """
+    db = SessionLocal()
+    
+    try:
+        file = db.query(File).filter(File.id == file_id).first()
+        if not file:
+            return {"status": "error", "message": "File not found"}
         
-        logger.info(f"Successfully processed file {file_id} with {len(all_chunks)} chunks")
+        # Delete from vector store
+        vector_store_service.delete_by_file_id(file.category_id, file_id)
         
-        return {
-            "status": "success",
-            "file_id": file_id,
-            "total_chunks": len(all_chunks)
-        }
+        # Delete physical file
+        if os.path.exists(file.file_path):
+            os.remove(file.file_path)
         
-    except Exception as e:
-        logger.error(f"Error processing file {file_id}: {e}")
+        # Delete from database (cascades to chunks)
+        db.delete(file)
+        db.commit()
         
-        # Update file status
-        file = db.query(File).filter(File.id == file_id).first()
-        if file:
-            file.status = "failed"
-            file.error_message = str(e)
-            db.commit()
+        logger.info(f"Deleted file: {file.original_filename} (ID: {file_id})")
         
+        return {"status": "success", "file_id": file_id}
+    
+    except Exception as e:
+        logger.error(f"Error deleting file {file_id}: {e}")
         return {"status": "error", "message": str(e)}
     
     finally:
-        db.close()
+        SessionLocal.remove()
+
+@celery_app.task(name="cleanup_category")
+def cleanup_category_task(category_id: int, file_paths: list):
+    """
+    Async task to remove vectors and uploads of a deleted category
+    
+    Args:
+        category_id: Deleted category ID
+        file_paths: Paths of the category's uploaded files
+    
+    Returns:
+        Cleanup result
+    """
+    try:
+        # Delete from vector store
+        vector_store_service.delete_by_category_id(category_id)
+        
+        # Delete physical files
+        for file_path in file_paths:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        
+        logger.info(f"Cleaned up category {category_id} ({len(file_paths)} files)")
+        
+        return {"status": "success", "category_id": category_id}
+    
+    except Exception as e:
+        logger.error(f"Error cleaning up category {category_id}: {e}")
+        return {"status": "error", "message": str(e)}